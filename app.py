@@ -3,16 +3,15 @@ import eventlet
 eventlet.monkey_patch()
 
 import os
-import select
 import subprocess
 
-from flask import Flask, render_template, request, jsonify
-from flask_socketio import SocketIO, emit, disconnect
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
+from flask_socketio import SocketIO, emit, disconnect, join_room
 from utils.pty_handler import PTYManager
 from utils.tool_manager import tool_manager
 from utils.file_manager import FileManager
 from utils.http_server import SimpleHttpServer
-from models import db, Workspace, Note, TerminalLog, ChecklistItem, Snippet
+from models import db, Workspace, Note, TerminalLog, ChecklistItem, Snippet, upgrade_schema
 import datetime
 
 app = Flask(__name__)
@@ -20,13 +19,40 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', os.urandom(24))
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///ctf_ops.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Terminal output coalescing: flush interval in seconds and max frame size in bytes
+app.config['PTY_FLUSH_INTERVAL'] = float(os.environ.get('PTY_FLUSH_INTERVAL', 0.008))
+app.config['PTY_MAX_FRAME'] = int(os.environ.get('PTY_MAX_FRAME', 65536))
+# Terminal history kept in memory per session, older output spills to PTY_SPILL_DIR
+app.config['PTY_SCROLLBACK_BYTES'] = int(os.environ.get('PTY_SCROLLBACK_BYTES', 1024 * 1024))
+app.config['PTY_SPILL_DIR'] = os.environ.get('PTY_SPILL_DIR')
+# Flow control: unacknowledged output bytes at which a terminal is paused / resumed
+app.config['PTY_HIGH_WATERMARK'] = int(os.environ.get('PTY_HIGH_WATERMARK', 256 * 1024))
+app.config['PTY_LOW_WATERMARK'] = int(os.environ.get('PTY_LOW_WATERMARK', 64 * 1024))
+# Seconds a disconnected client's terminals are kept alive for it to reattach
+app.config['PTY_DETACH_GRACE'] = float(os.environ.get('PTY_DETACH_GRACE', 300))
+# Pre-spawned /bin/bash PTYs kept warm for new terminals (0 disables the pool)
+app.config['PTY_POOL_SIZE'] = int(os.environ.get('PTY_POOL_SIZE', 2))
+# Seconds between SIGTERM and SIGKILL when a terminal is closed
+app.config['PTY_KILL_GRACE'] = float(os.environ.get('PTY_KILL_GRACE', 2))
 
 db.init_app(app)
 with app.app_context():
     db.create_all()
+    upgrade_schema()
 
 socketio = SocketIO(app, async_mode='eventlet')
-pty_manager = PTYManager()
+pty_manager = PTYManager(emit=socketio.emit,
+                         flush_interval=app.config['PTY_FLUSH_INTERVAL'],
+                         max_frame=app.config['PTY_MAX_FRAME'],
+                         scrollback_bytes=app.config['PTY_SCROLLBACK_BYTES'],
+                         spill_dir=app.config['PTY_SPILL_DIR'],
+                         high_watermark=app.config['PTY_HIGH_WATERMARK'],
+                         low_watermark=app.config['PTY_LOW_WATERMARK'],
+                         detach_grace=app.config['PTY_DETACH_GRACE'],
+                         pool_size=app.config['PTY_POOL_SIZE'],
+                         kill_grace=app.config['PTY_KILL_GRACE'])
+# Wake the reaper as soon as a terminal's process exits
+pty_manager.reaper.install_signal_handler()
 file_manager = FileManager('shared')
 http_server = SimpleHttpServer('shared')
 
@@ -232,12 +258,17 @@ def delete_snippet(snippet_id):
     return jsonify({'status': 'deleted'})
 
 
+@app.route('/api/terminals/stats', methods=['GET'])
+def get_terminal_stats():
+    # Terminal startup latency and warm pool usage
+    return jsonify(pty_manager.get_spawn_stats())
+
 @app.route('/api/terminals/<term_id>/archive', methods=['POST'])
 def archive_terminal(term_id):
     # This assumes we are archiving for the current request.sid?
     # Or we pass sid in body? SocketIO session is tied to request context for HTTP? No.
     # The client calls this via fetch(), so request.sid is NOT the socket sid.
-    # We need to pass the socket_id from client.
+    # We need to pass the socket_id from client (its client token, terminals are keyed by it).
     data = request.get_json()
     socket_id = data.get('socket_id')
     workspace_id = data.get('workspace_id')
@@ -245,15 +276,40 @@ def archive_terminal(term_id):
     if not socket_id or not workspace_id:
         return jsonify({'error': 'Missing params'}), 400
 
-    history = pty_manager.get_history(socket_id, term_id)
-    if not history:
+    log = TerminalLog(workspace_id=workspace_id, name=f"Archive: {term_id}")
+    log.write_chunks(pty_manager.iter_history(socket_id, term_id))
+    if not log.size:
         return jsonify({'error': 'No history found'}), 404
 
-    log = TerminalLog(workspace_id=workspace_id, name=f"Archive: {term_id}", content=history)
     db.session.add(log)
     db.session.commit()
     return jsonify({'status': 'archived', 'id': log.id})
 
+@app.route('/api/workspaces/<int:workspace_id>/logs', methods=['GET'])
+def get_terminal_logs(workspace_id):
+    logs = TerminalLog.query.filter_by(workspace_id=workspace_id).order_by(TerminalLog.created_at).all()
+    return jsonify([{'id': l.id, 'name': l.name, 'size': l.size, 'line_count': l.line_count,
+                     'created_at': l.created_at.isoformat()} for l in logs])
+
+@app.route('/api/logs/<int:log_id>', methods=['GET'])
+def stream_terminal_log(log_id):
+    """
+    Stream an archived log. ?start=&end= selects a byte range, ?line_start=&line_end=
+    a line range (0-based, end exclusive).
+    """
+    TerminalLog.query.get_or_404(log_id)
+    args = request.args
+
+    def generate():
+        # The request's session is gone once streaming starts, load the log again
+        log = db.session.get(TerminalLog, log_id)
+        if 'line_start' in args or 'line_end' in args:
+            yield from log.iter_lines(args.get('line_start', 0, type=int), args.get('line_end', type=int))
+        else:
+            yield from log.iter_range(args.get('start', 0, type=int), args.get('end', type=int))
+
+    return Response(stream_with_context(generate()), mimetype='text/plain; charset=utf-8')
+
 @app.route('/api/tools/nmap/save', methods=['POST'])
 def save_nmap_scan():
     data = request.get_json()
@@ -276,14 +332,32 @@ def save_nmap_scan():
     db.session.commit()
     return jsonify({'status': 'saved', 'note_id': note.id})
 
+# Socket sid -> client token. Terminals belong to the token (kept in the
+# browser's sessionStorage) so they survive a refresh or a dropped connection.
+clients = {}
+
+def client_id():
+    return clients.get(request.sid, request.sid)
+
 @socketio.on('connect')
-def connect():
-    print(f"Client connected: {request.sid}")
+def connect(auth=None):
+    token = (auth or {}).get('client_id') or request.sid
+    clients[request.sid] = token
+    # Terminal output is emitted to the token's room
+    join_room(token)
+    print(f"Client connected: {request.sid} ({token})")
 
 @socketio.on('disconnect')
-def disconnect_handler():
+def disconnect_handler(reason=None):
     print(f"Client disconnected: {request.sid}")
-    pty_manager.close_all_for_sid(request.sid)
+    token = clients.pop(request.sid, request.sid)
+    if token not in clients.values():
+        pty_manager.detach(token)
+
+@socketio.on('attach')
+def attach(data=None):
+    # Returned to the client's ack callback: live terminals with a screen snapshot
+    return pty_manager.attach(client_id())
 
 @socketio.on('start_terminal')
 def start_terminal(data):
@@ -291,65 +365,27 @@ def start_terminal(data):
     rows = data.get('rows', 24)
     cols = data.get('cols', 80)
     cmd = data.get('cmd', ["/bin/bash"])
+    flow_control = bool(data.get('flow_control', False))
 
-    pty_manager.spawn(request.sid, term_id, cmd=cmd)
-    pty_manager.resize(request.sid, term_id, cols, rows)
+    pty_manager.spawn(client_id(), term_id, cmd=cmd, flow_control=flow_control)
+    pty_manager.resize(client_id(), term_id, cols, rows)
     emit('terminal_started', {'status': 'ok', 'term_id': term_id})
 
 @socketio.on('resize')
 def resize(data):
     term_id = data.get('term_id', 'default')
-    pty_manager.resize(request.sid, term_id, data['cols'], data['rows'])
+    pty_manager.resize(client_id(), term_id, data['cols'], data['rows'])
+
+@socketio.on('output_ack')
+def output_ack(data):
+    term_id = data.get('term_id', 'default')
+    pty_manager.ack(client_id(), term_id, int(data.get('size', 0)))
 
 @socketio.on('input')
 def input_handler(data):
     term_id = data.get('term_id', 'default')
-    pty_manager.write(request.sid, term_id, data['input'])
-    # Archive history
-    pty_manager.append_history(request.sid, term_id, data['input']) # This saves INPUT. Output is better.
-
-def read_from_ptys():
-    """
-    Background task to read from PTY file descriptors and emit events to clients.
-    """
-    while True:
-        # Get all active sessions
-        keys = list(pty_manager.sessions.keys())
-        fds = [pty_manager.sessions[k]['fd'] for k in keys]
-
-        if not fds:
-            eventlet.sleep(0.1)
-            continue
-
-        timeout = 0.05
-        try:
-            fd_to_key = {pty_manager.sessions[k]['fd']: k for k in keys}
-
-            r, w, e = select.select(fds, [], [], timeout)
-            for fd in r:
-                key = fd_to_key.get(fd)
-                if key:
-                    sid, term_id = key
-                    try:
-                        data = os.read(fd, 8192)
-                        if data:
-                            decoded_data = data.decode('utf-8', errors='replace')
-                            # Append to history for archiving
-                            pty_manager.append_history(sid, term_id, decoded_data)
-                            # Emit to specific SID with term_id
-                            socketio.emit('output', {'output': decoded_data, 'term_id': term_id}, room=sid)
-                        else:
-                            # EOF
-                            pty_manager.close(sid, term_id)
-                            socketio.emit('disconnect_terminal', {'term_id': term_id}, room=sid)
-                    except OSError:
-                        pty_manager.close(sid, term_id)
-        except Exception:
-            pass
-
-        eventlet.sleep(0.01)
-
-socketio.start_background_task(read_from_ptys)
+    # Input reaches the history through the PTY echo, no need to record it twice
+    pty_manager.write(client_id(), term_id, data['input'])
 
 if __name__ == '__main__':
     socketio.run(app, debug=True, host='0.0.0.0', port=5000)
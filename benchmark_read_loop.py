@@ -1,12 +1,20 @@
+import eventlet
+eventlet.monkey_patch()
+
 import os
 import pty
 import time
+import random
 import select
+import subprocess
+
+from utils.pty_pump import PTYPump
 
 DATA_SIZE = 1 * 1024 * 1024  # 1 MB
 CHUNK_TO_WRITE = b"A" * 4096
+ECHO_SAMPLES = 200
 
-def benchmark(buffer_size, simulate_app_sleep=True):
+def spawn_writer():
     master_fd, slave_fd = pty.openpty()
 
     pid = os.fork()
@@ -23,38 +31,140 @@ def benchmark(buffer_size, simulate_app_sleep=True):
             pass
         os.close(slave_fd)
         os._exit(0)
-    else:
-        # Parent
-        os.close(slave_fd)
-        start_time = time.time()
-        total_read = 0
-
-        while True:
-            r, _, _ = select.select([master_fd], [], [], 0.05) # timeout matches app.py
-            if master_fd in r:
-                try:
-                    data = os.read(master_fd, buffer_size)
-                    if not data:
-                        break
-                    total_read += len(data)
-                    # Simulate processing overhead
-                    _ = data.decode('utf-8', errors='replace')
-                except OSError:
-                    break
-
-            if simulate_app_sleep:
-                time.sleep(0.01) # app.py sleeps 0.01s per loop iteration
-
-        end_time = time.time()
-        os.waitpid(pid, 0)
-        os.close(master_fd)
 
-        duration = end_time - start_time
-        throughput = total_read / duration / 1024 / 1024
-        print(f"Buffer: {buffer_size}, Time: {duration:.4f}s, Throughput: {throughput:.2f} MB/s")
+    os.close(slave_fd)
+    return master_fd, pid
+
+def polling_loop(fds, on_data, buffer_size=8192, simulate_app_sleep=True):
+    """The old app.read_from_ptys loop: select with a 50ms timeout, then sleep 10ms."""
+    while fds:
+        r, _, _ = select.select(list(fds), [], [], 0.05) # timeout matches app.py
+        for fd in r:
+            try:
+                data = os.read(fd, buffer_size)
+            except OSError:
+                data = b""
+            if not data:
+                fds.discard(fd)
+                continue
+            # Simulate processing overhead
+            _ = data.decode('utf-8', errors='replace')
+            on_data(fd, data)
+
+        if simulate_app_sleep:
+            eventlet.sleep(0.01) # app.py slept 0.01s per loop iteration
+
+def benchmark(buffer_size, simulate_app_sleep=True):
+    master_fd, pid = spawn_writer()
+    start_time = time.time()
+    total = [0]
+
+    def on_data(fd, data):
+        total[0] += len(data)
+
+    polling_loop({master_fd}, on_data, buffer_size, simulate_app_sleep)
+
+    duration = time.time() - start_time
+    os.waitpid(pid, 0)
+    os.close(master_fd)
+
+    throughput = total[0] / duration / 1024 / 1024
+    print(f"Buffer: {buffer_size}, Time: {duration:.4f}s, Throughput: {throughput:.2f} MB/s")
+
+def benchmark_pump():
+    master_fd, pid = spawn_writer()
+    start_time = time.time()
+    total = [0]
+    done = eventlet.Event()
+
+    def on_data(key, data):
+        _ = data.decode('utf-8', errors='replace')
+        total[0] += len(data)
+
+    pump = PTYPump(on_data, lambda key: done.send())
+    pump.register('bench', master_fd)
+    done.wait()
+
+    duration = time.time() - start_time
+    os.waitpid(pid, 0)
+    os.close(master_fd)
+
+    throughput = total[0] / duration / 1024 / 1024
+    print(f"Buffer: {pump.read_size}, Time: {duration:.4f}s, Throughput: {throughput:.2f} MB/s")
+
+def spawn_echo():
+    # The line discipline echoes keystrokes, cat just keeps the slave open
+    master_fd, slave_fd = pty.openpty()
+    p = subprocess.Popen(["cat"], stdin=slave_fd, stdout=slave_fd, stderr=slave_fd,
+                         start_new_session=True)
+    os.close(slave_fd)
+    return master_fd, p
+
+def measure_echo(master_fd, echoed):
+    """Write single keystrokes at random times and time how long the echo takes to be dispatched."""
+    samples = []
+    for _ in range(ECHO_SAMPLES):
+        # Keystrokes don't arrive in phase with the read loop
+        eventlet.sleep(random.uniform(0, 0.02))
+        echoed.reset()
+        start = time.perf_counter()
+        os.write(master_fd, b"x")
+        echoed.wait()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples
+
+def report_echo(samples):
+    p50 = samples[len(samples) // 2]
+    p99 = samples[int(len(samples) * 0.99) - 1]
+    print(f"Echo latency over {len(samples)} keystrokes: p50 {p50:.2f}ms, p99 {p99:.2f}ms, max {samples[-1]:.2f}ms")
+
+class Signal:
+    def __init__(self):
+        self.event = eventlet.Event()
+
+    def reset(self):
+        self.event = eventlet.Event()
+
+    def send(self, *args):
+        if not self.event.ready():
+            self.event.send()
+
+    def wait(self):
+        self.event.wait()
+
+def benchmark_echo_polling():
+    master_fd, p = spawn_echo()
+    echoed = Signal()
+    fds = {master_fd}
+    loop = eventlet.spawn(polling_loop, fds, echoed.send)
+    report_echo(measure_echo(master_fd, echoed))
+    loop.kill()
+    p.kill()
+    p.wait()
+    os.close(master_fd)
+
+def benchmark_echo_pump():
+    master_fd, p = spawn_echo()
+    echoed = Signal()
+    pump = PTYPump(echoed.send, lambda key: None)
+    pump.register('bench', master_fd)
+    report_echo(measure_echo(master_fd, echoed))
+    pump.unregister('bench')
+    p.kill()
+    p.wait()
+    os.close(master_fd)
+
+if __name__ == '__main__':
+    print("Throughput, old polling loop (select 50ms + sleep 10ms):")
+    print("Baseline (1024 bytes):")
+    benchmark(1024, simulate_app_sleep=True)
+    print("Optimized (8192 bytes):")
+    benchmark(8192, simulate_app_sleep=True)
+    print("\nThroughput, event-driven PTYPump:")
+    benchmark_pump()
 
-print("Benchmarking read loop performance (simulating app.py behavior with sleep):")
-print("Baseline (1024 bytes):")
-benchmark(1024, simulate_app_sleep=True)
-print("\nOptimized (8192 bytes):")
-benchmark(8192, simulate_app_sleep=True)
+    print("\nEcho latency, old polling loop:")
+    benchmark_echo_polling()
+    print("\nEcho latency, event-driven PTYPump:")
+    benchmark_echo_pump()
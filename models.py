@@ -1,5 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import deferred
 from datetime import datetime
+import zlib
 
 db = SQLAlchemy()
 
@@ -22,8 +24,86 @@ class TerminalLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     workspace_id = db.Column(db.Integer, db.ForeignKey('workspace.id'), nullable=False)
     name = db.Column(db.String(100), nullable=False)
-    content = db.Column(db.Text, nullable=True) # Full session log
+    # Legacy full session log, new archives are stored in TerminalLogChunk.
+    # Deferred so listing logs never loads it.
+    content = deferred(db.Column(db.Text, nullable=True))
+    size = db.Column(db.Integer, default=0) # Uncompressed bytes
+    line_count = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    chunks = db.relationship('TerminalLogChunk', backref='log', lazy='dynamic',
+                             cascade='all, delete-orphan', order_by='TerminalLogChunk.seq')
+
+    CHUNK_SIZE = 256 * 1024
+
+    def write_chunks(self, stream):
+        """Store an iterable of bytes as compressed chunks of CHUNK_SIZE."""
+        buf = bytearray()
+        seq = 0
+        self.size = 0
+        self.line_count = 0
+        for data in stream:
+            buf += data
+            while len(buf) >= self.CHUNK_SIZE:
+                self._add_chunk(seq, bytes(buf[:self.CHUNK_SIZE]))
+                del buf[:self.CHUNK_SIZE]
+                seq += 1
+        if buf:
+            self._add_chunk(seq, bytes(buf))
+
+    def _add_chunk(self, seq, data):
+        lines = data.count(b"\n")
+        self.chunks.append(TerminalLogChunk(seq=seq, offset=self.size, line_offset=self.line_count,
+                                            size=len(data), line_count=lines, data=zlib.compress(data)))
+        self.size += len(data)
+        self.line_count += lines
+
+    def iter_range(self, start=0, end=None):
+        """Yield the bytes in [start, end) one chunk at a time."""
+        if self.content is not None and self.chunks.count() == 0:
+            # Archive from before chunked storage
+            yield self.content.encode('utf-8')[start:end]
+            return
+        if end is None:
+            end = self.size
+
+        query = self.chunks.filter(TerminalLogChunk.offset + TerminalLogChunk.size > start,
+                                   TerminalLogChunk.offset < end)
+        for chunk in query.yield_per(4):
+            data = zlib.decompress(chunk.data)
+            yield data[max(start - chunk.offset, 0):end - chunk.offset]
+
+    def iter_lines(self, line_start=0, line_end=None):
+        """Yield lines [line_start, line_end) (0-based) one chunk at a time."""
+        if line_end is None:
+            line_end = self.line_count + 1
+        if self.content is not None and self.chunks.count() == 0:
+            lines = self.content.encode('utf-8').splitlines(keepends=True)
+            yield b"".join(lines[line_start:line_end])
+            return
+
+        query = self.chunks.filter(TerminalLogChunk.line_offset + TerminalLogChunk.line_count >= line_start,
+                                   TerminalLogChunk.line_offset < line_end)
+        line_no = None
+        for chunk in query.yield_per(4):
+            if line_no is None:
+                line_no = chunk.line_offset
+            out = []
+            for line in zlib.decompress(chunk.data).splitlines(keepends=True):
+                if line_start <= line_no < line_end:
+                    out.append(line)
+                if line.endswith(b"\n"):
+                    line_no += 1
+            yield b"".join(out)
+
+class TerminalLogChunk(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    log_id = db.Column(db.Integer, db.ForeignKey('terminal_log.id'), nullable=False, index=True)
+    seq = db.Column(db.Integer, nullable=False)
+    offset = db.Column(db.Integer, nullable=False) # Byte offset in the full log
+    line_offset = db.Column(db.Integer, nullable=False) # Lines before this chunk
+    size = db.Column(db.Integer, nullable=False) # Uncompressed bytes
+    line_count = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False) # zlib compressed
 
 class ChecklistItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -37,3 +117,22 @@ class Snippet(db.Model):
     name = db.Column(db.String(100), nullable=False)
     command = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+def upgrade_schema():
+    """
+    db.create_all() only creates missing tables, add the columns introduced
+    since an existing database was created.
+    """
+    inspector = db.inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(db.engine.dialect)}"
+                if column.default is not None and column.default.is_scalar:
+                    ddl += f" DEFAULT {column.default.arg!r}"
+                conn.execute(db.text(ddl))
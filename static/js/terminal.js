@@ -1,8 +1,19 @@
 document.addEventListener('DOMContentLoaded', () => {
-    const socket = io();
+    // Stable per-tab token: terminals are keyed by it on the server, so they
+    // survive a refresh or a dropped connection and can be reattached.
+    let clientId = sessionStorage.getItem('clientId');
+    if (!clientId) {
+        const bytes = new Uint8Array(16);
+        crypto.getRandomValues(bytes);
+        clientId = Array.from(bytes, b => b.toString(16).padStart(2, '0')).join('');
+        sessionStorage.setItem('clientId', clientId);
+    }
+    const socket = io({ auth: { client_id: clientId } });
     const terminals = {}; // term_id -> { term, fit, el }
     let activeTermId = null;
     let termCounter = 0;
+    // Acknowledge rendered output in batches of this many bytes
+    const OUTPUT_ACK_BYTES = 16 * 1024;
 
     // Workspace State
     let currentWorkspaceId = localStorage.getItem('currentWorkspaceId');
@@ -433,10 +444,19 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // --- Terminals ---
 
-    function createTerminal(termId, initialCommand) {
+    function createTerminal(termId, initialCommand, snapshot) {
+        let termNumber = null;
         if (!termId) {
             termCounter++;
             termId = `term_${termCounter}`;
+            termNumber = termCounter;
+        } else {
+            // Reattached terminals keep their id, don't hand it out again
+            const m = /^term_(\d+)$/.exec(termId);
+            if (m) {
+                termNumber = parseInt(m[1]);
+                termCounter = Math.max(termCounter, termNumber);
+            }
         }
 
         // Create DOM Element
@@ -457,9 +477,11 @@ document.addEventListener('DOMContentLoaded', () => {
         const fitAddon = new FitAddon.FitAddon();
         term.loadAddon(fitAddon);
         term.open(el);
+        if (snapshot) term.write(snapshot);
 
         // Store session
-        terminals[termId] = { term, fit: fitAddon, el };
+        // unacked: output bytes rendered but not yet acknowledged (flow control)
+        terminals[termId] = { term, fit: fitAddon, el, unacked: 0 };
 
         // Bind events
         term.onData(data => socket.emit('input', { input: data, term_id: termId }));
@@ -481,7 +503,7 @@ document.addEventListener('DOMContentLoaded', () => {
              const target = parts[parts.length - 1];
              label.innerText = target;
         } else {
-            label.innerText = `Terminal ${termCounter}`;
+            label.innerText = `Terminal ${termNumber}`;
         }
         tab.appendChild(label);
 
@@ -535,7 +557,7 @@ document.addEventListener('DOMContentLoaded', () => {
              // PTYManager expects a list for spawn.
              // Simplest approach: Spawn bash, then write the command if provided.
 
-             socket.emit('start_terminal', { term_id: termId, cols: term.cols, rows: term.rows });
+             socket.emit('start_terminal', { term_id: termId, cols: term.cols, rows: term.rows, flow_control: true });
 
              if (initialCommand) {
                  // Wait a tiny bit for the shell to be ready
@@ -615,7 +637,7 @@ document.addEventListener('DOMContentLoaded', () => {
         fetch(`/api/terminals/${termId}/archive`, {
             method: 'POST',
             headers: {'Content-Type': 'application/json'},
-            body: JSON.stringify({socket_id: socket.id, workspace_id: currentWorkspaceId})
+            body: JSON.stringify({socket_id: clientId, workspace_id: currentWorkspaceId})
         })
         .then(r => r.json())
         .then(data => {
@@ -639,9 +661,28 @@ document.addEventListener('DOMContentLoaded', () => {
         loadSnippets(); // Load snippets on connect
         autoDetectLHOST(); // Auto Detect IP
 
-        if (Object.keys(terminals).length === 0) {
-            createTerminal('default');
-        }
+        // Reattach terminals still alive on the server (after a refresh or a
+        // dropped connection), restoring their screen from a snapshot.
+        socket.emit('attach', {}, sessions => {
+            const alive = new Set(sessions.map(s => s.term_id));
+            Object.keys(terminals).forEach(id => {
+                if (!alive.has(id)) {
+                    terminals[id].term.write('\r\n\x1b[31m[Session Lost]\x1b[0m\r\n');
+                }
+            });
+            sessions.forEach(s => {
+                if (terminals[s.term_id]) {
+                    terminals[s.term_id].term.reset();
+                    terminals[s.term_id].term.write(s.snapshot);
+                    terminals[s.term_id].unacked = 0;
+                } else {
+                    createTerminal(s.term_id, null, s.snapshot);
+                }
+            });
+            if (Object.keys(terminals).length === 0) {
+                createTerminal('default');
+            }
+        });
 
         // Fetch statuses
         fetch('/api/tools/webdav/status')
@@ -682,7 +723,17 @@ document.addEventListener('DOMContentLoaded', () => {
             // Highlight IP addresses in Cyan
             // out = out.replace(/(\b\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}\b)/g, '\x1b[36m$1\x1b[0m');
 
-            terminals[data.term_id].term.write(out);
+            const t = terminals[data.term_id];
+            const size = data.size || 0;
+            // Ack once xterm has actually rendered the data, the server pauses
+            // the PTY while too much output is unacknowledged.
+            t.term.write(out, () => {
+                t.unacked += size;
+                if (t.unacked >= OUTPUT_ACK_BYTES) {
+                    socket.emit('output_ack', { term_id: data.term_id, size: t.unacked });
+                    t.unacked = 0;
+                }
+            });
         }
     });
 
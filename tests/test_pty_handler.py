@@ -1,6 +1,7 @@
 import unittest
 from unittest.mock import patch, MagicMock
 import os
+import eventlet
 from utils.pty_handler import PTYManager
 
 class TestPTYManager(unittest.TestCase):
@@ -28,6 +29,7 @@ class TestPTYManager(unittest.TestCase):
         mock_openpty.return_value = (10, 11)
         mock_popen.return_value = MagicMock()
         self.manager.spawn("sid1", "term1")
+        mock_write.return_value = len(b"test data")
 
         # Call write
         self.manager.write("sid1", "term1", "test data")
@@ -61,5 +63,171 @@ class TestPTYManager(unittest.TestCase):
         self.manager.write("sid1", "term1", "test data")
         mock_write.assert_not_called()
 
+    @patch('pty.openpty')
+    @patch('subprocess.Popen')
+    @patch('os.close')
+    def test_spawn_registers_with_pump(self, mock_close, mock_popen, mock_openpty):
+        mock_openpty.return_value = (10, 11)
+        mock_popen.return_value = MagicMock()
+        manager = PTYManager(emit=MagicMock())
+        manager.pump = MagicMock()
+
+        manager.spawn("sid1", "term1")
+        manager.pump.register.assert_called_once_with(("sid1", "term1"), 10)
+
+        manager.close("sid1", "term1")
+        manager.pump.unregister.assert_called_once_with(("sid1", "term1"))
+
+    @patch('pty.openpty')
+    @patch('subprocess.Popen')
+    @patch('os.close')
+    def test_output_is_coalesced(self, mock_close, mock_popen, mock_openpty):
+        mock_openpty.return_value = (10, 11)
+        mock_popen.return_value = MagicMock()
+        emit = MagicMock()
+        manager = PTYManager(emit=emit, flush_interval=0.05, max_frame=1024)
+        manager.pump = MagicMock()
+        manager.spawn("sid1", "term1")
+        key = ("sid1", "term1")
+
+        # First chunk after a quiet period goes out immediately
+        manager._on_output(key, b"$ ")
+        emit.assert_called_once_with('output', {'output': '$ ', 'term_id': 'term1', 'size': 2}, room="sid1")
+
+        # A burst is held back until the flush interval...
+        for _ in range(10):
+            manager._on_output(key, b"line\n")
+        self.assertEqual(emit.call_count, 1)
+        eventlet.sleep(0.1)
+        self.assertEqual(emit.call_count, 2)
+        self.assertEqual(emit.call_args.args[1]['output'], "line\n" * 10)
+
+        # ...or until it reaches max_frame
+        manager._on_output(key, b"x" * 2048)
+        self.assertEqual(emit.call_count, 3)
+
+    @patch('pty.openpty')
+    @patch('subprocess.Popen')
+    @patch('os.close')
+    def test_split_multibyte_characters(self, mock_close, mock_popen, mock_openpty):
+        mock_openpty.return_value = (10, 11)
+        mock_popen.return_value = MagicMock()
+        emit = MagicMock()
+        manager = PTYManager(emit=emit, flush_interval=0)
+        manager.pump = MagicMock()
+        manager.spawn("sid1", "term1")
+
+        data = "é→".encode('utf-8')
+        for i in range(len(data)):
+            manager._on_output(("sid1", "term1"), data[i:i + 1])
+
+        output = "".join(c.args[1]['output'] for c in emit.call_args_list)
+        self.assertEqual(output, "é→")
+
+    @patch('pty.openpty')
+    @patch('subprocess.Popen')
+    @patch('os.close')
+    def test_flow_control_pauses_and_resumes(self, mock_close, mock_popen, mock_openpty):
+        mock_openpty.return_value = (10, 11)
+        mock_popen.return_value = MagicMock()
+        manager = PTYManager(emit=MagicMock(), flush_interval=0, max_frame=1024,
+                             high_watermark=4096, low_watermark=1024)
+        manager.pump = MagicMock()
+        manager.spawn("sid1", "term1", flow_control=True)
+        key = ("sid1", "term1")
+
+        for _ in range(3):
+            manager._on_output(key, b"y\n" * 512)
+        manager.pump.pause.assert_not_called()
+        manager._on_output(key, b"y\n" * 512)
+        manager.pump.pause.assert_called_once_with(key)
+
+        manager.ack("sid1", "term1", 2048)
+        manager.pump.resume.assert_not_called()
+        manager.ack("sid1", "term1", 2048)
+        manager.pump.resume.assert_called_once_with(key)
+
+    @patch('pty.openpty')
+    @patch('subprocess.Popen')
+    @patch('os.close')
+    def test_detach_and_reattach(self, mock_close, mock_popen, mock_openpty):
+        mock_openpty.return_value = (10, 11)
+        mock_popen.return_value = MagicMock()
+        manager = PTYManager(emit=MagicMock(), detach_grace=0.05)
+        manager.pump = MagicMock()
+        manager.spawn("client1", "term1")
+        manager._on_output(("client1", "term1"), b"hello")
+
+        manager.detach("client1")
+        terminals = manager.attach("client1")
+        self.assertEqual([t['term_id'] for t in terminals], ["term1"])
+        self.assertIn("hello", terminals[0]['snapshot'])
+
+        # Not reattached within the grace period
+        manager.detach("client1")
+        eventlet.sleep(0.1)
+        self.assertEqual(manager.sessions, {})
+        self.assertEqual(manager.attach("client1"), [])
+
+    @patch('eventlet.spawn')
+    @patch('os.write')
+    @patch('pty.openpty')
+    @patch('subprocess.Popen')
+    @patch('os.close')
+    def test_write_queues_on_eagain(self, mock_close, mock_popen, mock_openpty, mock_write, mock_spawn):
+        mock_openpty.return_value = (10, 11)
+        mock_popen.return_value = MagicMock()
+        self.manager.spawn("sid1", "term1")
+        session = self.manager.sessions[("sid1", "term1")]
+
+        # Partial write, then the PTY is full
+        mock_write.side_effect = [4, BlockingIOError()]
+        self.manager.write("sid1", "term1", "paste data")
+        self.assertEqual(session["inbuf"], b"e data")
+        mock_spawn.assert_called_once_with(self.manager._drain, ("sid1", "term1"))
+        session["writer"] = mock_spawn.return_value
+
+        # More input while the writer waits is batched behind it
+        self.manager.write("sid1", "term1", "!")
+        self.assertEqual(mock_write.call_count, 2)
+        self.assertEqual(session["inbuf"], b"e data!")
+
+        mock_write.side_effect = lambda fd, data: len(data)
+        self.assertTrue(self.manager._write_pending(session))
+        mock_write.assert_called_with(10, b"e data!")
+        self.assertEqual(session["inbuf"], b"")
+
+class TestPTYPump(unittest.TestCase):
+    def test_output_and_exit_are_emitted(self):
+        emit = MagicMock()
+        manager = PTYManager(emit=emit)
+        manager.spawn("sid1", "term1", cmd=["/bin/echo", "hello"])
+
+        with eventlet.Timeout(5):
+            while ("sid1", "term1") in manager.sessions:
+                eventlet.sleep(0.01)
+
+        output = "".join(c.args[1]['output'] for c in emit.call_args_list if c.args[0] == 'output')
+        self.assertIn("hello", output)
+        emit.assert_called_with('disconnect_terminal', {'term_id': 'term1'}, room="sid1")
+        self.assertEqual(manager.pump.readers, {})
+
+    def test_unacked_output_is_bounded(self):
+        emit = MagicMock()
+        manager = PTYManager(emit=emit, high_watermark=64 * 1024, low_watermark=16 * 1024)
+        manager.spawn("sid1", "term1", cmd=["yes"], flow_control=True)
+        try:
+            eventlet.sleep(0.5)
+            self.assertIn(("sid1", "term1"), manager.pump.paused)
+            emitted = sum(c.args[1]['size'] for c in emit.call_args_list if c.args[0] == 'output')
+            self.assertLess(emitted, 64 * 1024 + manager.max_frame + manager.pump.read_size)
+
+            manager.ack("sid1", "term1", emitted)
+            eventlet.sleep(0.1)
+            more = sum(c.args[1]['size'] for c in emit.call_args_list if c.args[0] == 'output')
+            self.assertGreater(more, emitted)
+        finally:
+            manager.close("sid1", "term1")
+
 if __name__ == '__main__':
     unittest.main()
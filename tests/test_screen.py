@@ -0,0 +1,31 @@
+import unittest
+from utils.screen import ScreenMirror
+
+class TestScreenMirror(unittest.TestCase):
+    def test_snapshot_restores_screen(self):
+        screen = ScreenMirror(cols=20, rows=5)
+        screen.feed("$ ls\r\n\x1b[1;34mdir\x1b[0m  file\r\n$ ")
+        snapshot = screen.snapshot()
+
+        # Replaying the snapshot on a fresh screen gives the same display
+        replay = ScreenMirror(cols=20, rows=5)
+        replay.feed(snapshot)
+        self.assertEqual(replay.screen.display, screen.screen.display)
+        self.assertEqual(replay.screen.buffer[1][0].fg, "blue")
+        self.assertTrue(replay.screen.buffer[1][0].bold)
+        self.assertEqual((replay.screen.cursor.x, replay.screen.cursor.y), (2, 2))
+
+    def test_snapshot_size_does_not_depend_on_history(self):
+        screen = ScreenMirror(cols=80, rows=24)
+        screen.feed("line\r\n" * 100)
+        small = len(screen.snapshot())
+        screen.feed("line\r\n" * 100000)
+        self.assertEqual(len(screen.snapshot()), small)
+
+    def test_truecolor(self):
+        screen = ScreenMirror(cols=10, rows=2)
+        screen.feed("\x1b[38;2;10;20;30mX")
+        self.assertIn("38;2;10;20;30", screen.snapshot())
+
+if __name__ == '__main__':
+    unittest.main()
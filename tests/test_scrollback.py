@@ -0,0 +1,40 @@
+import os
+import unittest
+import tempfile
+from utils.scrollback import Scrollback
+
+class TestScrollback(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.scrollback = Scrollback(max_bytes=1024, segment_size=256, spill_dir=self.tmpdir.name)
+
+    def tearDown(self):
+        self.scrollback.close()
+        self.tmpdir.cleanup()
+
+    def test_small_history_stays_in_memory(self):
+        self.scrollback.append("hello ")
+        self.scrollback.append(b"world")
+        self.assertEqual(b"".join(self.scrollback.iter_chunks()), b"hello world")
+        self.assertIsNone(self.scrollback.spill_path)
+
+    def test_memory_is_capped_and_history_is_complete(self):
+        expected = b"".join(b"line %05d\n" % i for i in range(2000))
+        for i in range(0, len(expected), 100):
+            self.scrollback.append(expected[i:i + 100])
+            self.assertLessEqual(self.scrollback.mem_bytes, 1024 + 256)
+
+        self.assertTrue(os.path.exists(self.scrollback.spill_path))
+        self.assertEqual(len(self.scrollback), len(expected))
+        self.assertEqual(b"".join(self.scrollback.iter_chunks(chunk_size=500)), expected)
+
+    def test_close_removes_spill_file(self):
+        self.scrollback.append(b"x" * 4096)
+        path = self.scrollback.spill_path
+        self.assertTrue(os.path.exists(path))
+        self.scrollback.close()
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(len(self.scrollback), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import eventlet
+from utils.shell_pool import ShellPool
+
+class TestShellPool(unittest.TestCase):
+    def setUp(self):
+        self.spawned = 0
+
+    def spawn(self):
+        self.spawned += 1
+        process = MagicMock()
+        process.poll.return_value = None
+        return (100 + self.spawned, process)
+
+    def test_take_returns_warm_shell_and_refills(self):
+        pool = ShellPool(2, self.spawn)
+        pool.start()
+        eventlet.sleep(0.01)
+        self.assertEqual(len(pool.idle), 2)
+
+        fd, process = pool.take()
+        self.assertEqual(fd, 101)
+        eventlet.sleep(0.01)
+        self.assertEqual(len(pool.idle), 2)
+        self.assertEqual(self.spawned, 3)
+
+    def test_dead_shells_are_skipped(self):
+        pool = ShellPool(2, self.spawn)
+        pool.start()
+        eventlet.sleep(0.01)
+        pool.idle[0][1].poll.return_value = 0
+
+        with patch('os.close') as mock_close:
+            fd, process = pool.take()
+        self.assertEqual(fd, 102)
+        mock_close.assert_called_once_with(101)
+
+    def test_empty_pool_returns_none(self):
+        pool = ShellPool(1, self.spawn)
+        self.assertIsNone(pool.take())
+
+if __name__ == '__main__':
+    unittest.main()
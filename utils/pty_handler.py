@@ -4,51 +4,187 @@ import subprocess
 import struct
 import fcntl
 import termios
+import codecs
+import time
+import eventlet
+from eventlet.hubs import trampoline
+from utils.pty_pump import PTYPump
+from utils.scrollback import Scrollback
+from utils.screen import ScreenMirror
+from utils.shell_pool import ShellPool
+from utils.reaper import Reaper
+
+DEFAULT_SHELL = ["/bin/bash"]
+# Largest single write to a PTY, its input buffer only holds a few KB anyway
+WRITE_CHUNK = 16 * 1024
 
 class PTYManager:
-    def __init__(self):
-        # Key: (sid, term_id) -> {fd, process, history: []}
+    def __init__(self, emit=None, flush_interval=0.008, max_frame=65536,
+                 scrollback_bytes=1024 * 1024, spill_dir=None,
+                 high_watermark=256 * 1024, low_watermark=64 * 1024,
+                 detach_grace=300, pool_size=0, kill_grace=2.0):
+        # Key: (sid, term_id) -> {fd, process, history: Scrollback, screen, output buffer state}
+        # sid is the client's stable session token, not the socket id, so
+        # terminals survive a reconnect.
         self.sessions = {}
+        # emit(event, payload, room=...) - typically socketio.emit.
+        # Without it nothing reads the PTYs (e.g. in unit tests).
+        self.emit = emit
+        self.pump = PTYPump(self._on_output, self._on_eof) if emit else None
+        # Output is coalesced per terminal: a frame goes out once it reaches
+        # max_frame bytes or flush_interval seconds after the first chunk.
+        self.flush_interval = flush_interval
+        self.max_frame = max_frame
+        # History kept in memory per terminal, older output spills to spill_dir
+        self.scrollback_bytes = scrollback_bytes
+        self.spill_dir = spill_dir
+        # Flow control: stop reading a PTY once this many emitted bytes are
+        # not yet acknowledged by the client, resume below the low watermark.
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        # Detached clients keep their terminals for detach_grace seconds
+        self.detach_grace = detach_grace
+        # sid -> GreenThread closing its terminals when the grace period ends
+        self.detached = {}
+        # Terminates closed sessions' process groups in the background
+        self.reaper = Reaper(grace=kill_grace)
+        # Built once rather than copying os.environ on every spawn
+        self.env = dict(os.environ, TERM="xterm-256color")
+        # Warm DEFAULT_SHELL PTYs for instant terminal startup
+        self.pool = None
+        if pool_size > 0:
+            self.pool = ShellPool(pool_size, lambda: self._open_pty(DEFAULT_SHELL))
+            self.pool.start()
+        # Terminal startup latency
+        self.spawn_stats = {"count": 0, "pool_hits": 0, "last_ms": 0.0, "max_ms": 0.0, "total_ms": 0.0}
 
-    def spawn(self, sid, term_id, cmd=None):
+    def spawn(self, sid, term_id, cmd=None, flow_control=False):
         if cmd is None:
-            cmd = ["/bin/bash"]
+            cmd = DEFAULT_SHELL
 
         key = (sid, term_id)
         if key in self.sessions:
             # Already exists, ignore or restart? Let's ignore.
             return self.sessions[key]["fd"]
 
+        start = time.perf_counter()
+        shell = None
+        if self.pool and list(cmd) == DEFAULT_SHELL:
+            shell = self.pool.take()
+        if shell is not None:
+            self.spawn_stats["pool_hits"] += 1
+        else:
+            shell = self._open_pty(cmd)
+        master_fd, p = shell
+
+        self.sessions[key] = {
+            "fd": master_fd,
+            "process": p,
+            "history": Scrollback(self.scrollback_bytes, spill_dir=self.spill_dir),
+            "outbuf": bytearray(),
+            # Keeps multibyte characters split across reads intact
+            "decoder": codecs.getincrementaldecoder('utf-8')(errors='replace'),
+            "flush_timer": None,
+            "last_flush": 0.0,
+            # Only clients that send output_ack take part in flow control
+            "flow_control": flow_control,
+            "unacked": 0,
+            # Server-side view of the screen, sent to reattaching clients
+            "screen": ScreenMirror(),
+            # Input not yet taken by the PTY and the greenthread draining it
+            "inbuf": bytearray(),
+            "writer": None,
+        }
+        if self.pump:
+            self.pump.register(key, master_fd)
+
+        elapsed = (time.perf_counter() - start) * 1000
+        stats = self.spawn_stats
+        stats["count"] += 1
+        stats["last_ms"] = elapsed
+        stats["max_ms"] = max(stats["max_ms"], elapsed)
+        stats["total_ms"] += elapsed
+        return master_fd
+
+    def _open_pty(self, cmd):
         # create pseudo-terminal
         master_fd, slave_fd = pty.openpty()
 
-        env = os.environ.copy()
-        env["TERM"] = "xterm-256color"
-
+        # start_new_session instead of preexec_fn=os.setsid: no Python
+        # callback in the child, so subprocess can use the vfork fast path
         p = subprocess.Popen(
             cmd,
-            preexec_fn=os.setsid,
+            start_new_session=True,
             stdin=slave_fd,
             stdout=slave_fd,
             stderr=slave_fd,
-            env=env,
+            env=self.env,
             shell=False
         )
         os.close(slave_fd) # Close slave in parent
+        try:
+            # Writes must never block the hub when the PTY input buffer is full
+            os.set_blocking(master_fd, False)
+        except OSError:
+            pass
+        return master_fd, p
 
-        self.sessions[key] = {"fd": master_fd, "process": p, "history": []}
-        return master_fd
+    def get_spawn_stats(self):
+        stats = dict(self.spawn_stats)
+        stats["avg_ms"] = stats["total_ms"] / stats["count"] if stats["count"] else 0.0
+        stats["pool_idle"] = len(self.pool.idle) if self.pool else 0
+        return stats
 
     def write(self, sid, term_id, data):
         key = (sid, term_id)
-        if key in self.sessions:
-            fd = self.sessions[key]["fd"]
+        session = self.sessions.get(key)
+        if session is None:
+            return
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        # Input arriving while earlier input is still queued is batched into
+        # the same write once the PTY accepts more.
+        session["inbuf"] += data
+        if session["writer"] is None and not self._write_pending(session):
+            session["writer"] = eventlet.spawn(self._drain, key)
+
+    def _write_pending(self, session):
+        """Write queued input without blocking, returns True once the queue is empty."""
+        buf = session["inbuf"]
+        while buf:
             try:
-                if isinstance(data, str):
-                    data = data.encode('utf-8')
-                os.write(fd, data)
+                n = os.write(session["fd"], bytes(buf[:WRITE_CHUNK]))
+            except BlockingIOError:
+                # PTY input buffer full, wait until the fd is writable
+                return False
             except OSError:
-                pass
+                buf.clear()
+                break
+            del buf[:n]
+        return True
+
+    def _drain(self, key):
+        while True:
+            session = self.sessions.get(key)
+            if session is None:
+                return
+            try:
+                trampoline(session["fd"], write=True)
+            except OSError:
+                session["inbuf"].clear()
+            if self._write_pending(session):
+                session["writer"] = None
+                return
+
+    def ack(self, sid, term_id, nbytes):
+        """The client has rendered nbytes of output."""
+        key = (sid, term_id)
+        session = self.sessions.get(key)
+        if session is None:
+            return
+        session["unacked"] = max(session["unacked"] - nbytes, 0)
+        if self.pump and session["unacked"] <= self.low_watermark:
+            self.pump.resume(key)
 
     def resize(self, sid, term_id, cols, rows):
         key = (sid, term_id)
@@ -59,6 +195,7 @@ class PTYManager:
                 fcntl.ioctl(fd, termios.TIOCSWINSZ, winsize)
             except OSError:
                 pass
+            self.sessions[key]["screen"].resize(cols, rows)
 
     def close(self, sid, term_id):
         key = (sid, term_id)
@@ -66,22 +203,58 @@ class PTYManager:
             self._close_session(key)
 
     def close_all_for_sid(self, sid):
-        # Find all keys matching sid
+        # Find all keys matching sid, teardown happens in the background
         keys_to_close = [k for k in self.sessions.keys() if k[0] == sid]
         for key in keys_to_close:
             self._close_session(key)
 
+    def detach(self, sid):
+        """The client went away, close its terminals unless it reattaches in time."""
+        if sid in self.detached or not any(k[0] == sid for k in self.sessions):
+            return
+        self.detached[sid] = eventlet.spawn_after(self.detach_grace, self._expire, sid)
+
+    def attach(self, sid):
+        """
+        Cancel a pending detach and return the client's live terminals with a
+        snapshot of their screen.
+        """
+        timer = self.detached.pop(sid, None)
+        if timer is not None:
+            timer.cancel()
+
+        terminals = []
+        for key, session in list(self.sessions.items()):
+            if key[0] != sid:
+                continue
+            # Nothing acked while detached, start over with the snapshot
+            session["unacked"] = 0
+            if self.pump:
+                self.pump.resume(key)
+            screen = session["screen"]
+            terminals.append({'term_id': key[1], 'snapshot': screen.snapshot(),
+                              'cols': screen.cols, 'rows': screen.rows})
+        return terminals
+
+    def _expire(self, sid):
+        self.detached.pop(sid, None)
+        self.close_all_for_sid(sid)
+
     def _close_session(self, key):
         session = self.sessions[key]
+        if self.pump:
+            self.pump.unregister(key)
+        if session["flush_timer"] is not None:
+            session["flush_timer"].cancel()
+        if session["writer"] is not None and session["writer"] is not eventlet.getcurrent():
+            session["writer"].kill()
         try:
             os.close(session["fd"])
         except OSError:
             pass
-        try:
-            session["process"].terminate()
-            session["process"].wait(timeout=1)
-        except:
-            pass
+        # SIGTERM, then SIGKILL after kill_grace, without waiting here
+        self.reaper.reap(session["process"])
+        session["history"].close()
         if key in self.sessions:
             del self.sessions[key]
 
@@ -89,14 +262,67 @@ class PTYManager:
         key = (sid, term_id)
         if key in self.sessions:
             try:
-                if isinstance(data, bytes):
-                    data = data.decode('utf-8', errors='replace')
                 self.sessions[key]["history"].append(data)
-            except:
+            except OSError:
                 pass
 
-    def get_history(self, sid, term_id):
+    def iter_history(self, sid, term_id):
+        """Stream the full history of a terminal as bytes chunks."""
         key = (sid, term_id)
         if key in self.sessions:
-            return "".join(self.sessions[key]["history"])
-        return ""
+            return self.sessions[key]["history"].iter_chunks()
+        return iter(())
+
+    def get_history(self, sid, term_id):
+        return b"".join(self.iter_history(sid, term_id)).decode('utf-8', errors='replace')
+
+    def _on_output(self, key, data):
+        session = self.sessions.get(key)
+        if session is None:
+            return
+        session["outbuf"] += data
+
+        if len(session["outbuf"]) >= self.max_frame:
+            self._flush(key)
+        elif session["flush_timer"] is None:
+            # After a quiet period (e.g. a keystroke echo) flush right away,
+            # while streaming output let the buffer fill until the timer fires.
+            if time.monotonic() - session["last_flush"] >= self.flush_interval:
+                self._flush(key)
+            else:
+                session["flush_timer"] = eventlet.spawn_after(self.flush_interval, self._flush, key)
+
+    def _flush(self, key, final=False):
+        session = self.sessions.get(key)
+        if session is None:
+            return
+        timer = session["flush_timer"]
+        if timer is not None and timer is not eventlet.getcurrent():
+            timer.cancel()
+        session["flush_timer"] = None
+        session["last_flush"] = time.monotonic()
+
+        data = bytes(session["outbuf"])
+        session["outbuf"].clear()
+        sid, term_id = key
+        # Append raw bytes to history for archiving
+        if data:
+            self.append_history(sid, term_id, data)
+
+        decoded_data = session["decoder"].decode(data, final)
+        if not decoded_data:
+            return
+        session["screen"].feed(decoded_data)
+        # Emit to specific SID with term_id, size is what the client acks
+        self.emit('output', {'output': decoded_data, 'term_id': term_id, 'size': len(data)}, room=sid)
+
+        if session["flow_control"]:
+            session["unacked"] += len(data)
+            if session["unacked"] >= self.high_watermark:
+                self.pump.pause(key)
+
+    def _on_eof(self, key):
+        sid, term_id = key
+        self._flush(key, final=True)
+        self.close(sid, term_id)
+        self.emit('disconnect_terminal', {'term_id': term_id}, room=sid)
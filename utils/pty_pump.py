@@ -0,0 +1,60 @@
+import os
+import eventlet
+from eventlet.hubs import trampoline
+
+class PTYPump:
+    """
+    Event-driven reader for PTY master fds.
+
+    Each registered fd gets its own greenthread parked on the eventlet hub
+    until the fd becomes readable, so output is dispatched as soon as it
+    arrives instead of on the next tick of a polling loop.
+    """
+    def __init__(self, on_data, on_eof, read_size=65536):
+        self.on_data = on_data
+        self.on_eof = on_eof
+        self.read_size = read_size
+        # Key: (sid, term_id) -> GreenThread
+        self.readers = {}
+        # Key: (sid, term_id) -> Event the reader waits on while paused
+        self.paused = {}
+
+    def register(self, key, fd):
+        if key in self.readers:
+            return
+        self.readers[key] = eventlet.spawn(self._run, key, fd)
+
+    def unregister(self, key):
+        self.paused.pop(key, None)
+        reader = self.readers.pop(key, None)
+        # The reader unregisters itself on EOF, it can't kill itself
+        if reader is not None and reader is not eventlet.getcurrent():
+            reader.kill()
+
+    def pause(self, key):
+        """Stop reading the fd, the kernel PTY buffer then throttles the child."""
+        if key in self.readers and key not in self.paused:
+            self.paused[key] = eventlet.Event()
+
+    def resume(self, key):
+        gate = self.paused.pop(key, None)
+        if gate is not None:
+            gate.send()
+
+    def _run(self, key, fd):
+        while True:
+            gate = self.paused.get(key)
+            if gate is not None:
+                gate.wait()
+            try:
+                trampoline(fd, read=True)
+                data = os.read(fd, self.read_size)
+            except OSError:
+                # EIO once the child side is gone, or the fd was closed under us
+                data = b""
+
+            if not data:
+                self.readers.pop(key, None)
+                self.on_eof(key)
+                return
+            self.on_data(key, data)
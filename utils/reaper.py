@@ -0,0 +1,87 @@
+import os
+import time
+import signal
+import eventlet
+from eventlet.hubs import trampoline
+
+class Reaper:
+    """
+    Background teardown of terminal processes.
+
+    reap() sends SIGTERM to the process group created by start_new_session
+    and returns immediately. A single greenthread then waits for the groups
+    to go away, woken by SIGCHLD through a self-pipe, and escalates to
+    SIGKILL for anything still alive after `grace` seconds.
+    """
+    def __init__(self, grace=2.0, poll_interval=0.5):
+        self.grace = grace
+        self.poll_interval = poll_interval
+        # pid (== pgid) -> {process, deadline, killed}
+        self.pending = {}
+        self.loop = None
+        self.wake_r, self.wake_w = os.pipe()
+        os.set_blocking(self.wake_r, False)
+        os.set_blocking(self.wake_w, False)
+
+    def install_signal_handler(self):
+        """Must be called from the main thread."""
+        signal.signal(signal.SIGCHLD, self._on_sigchld)
+
+    def _on_sigchld(self, signum, frame):
+        try:
+            os.write(self.wake_w, b"\0")
+        except OSError:
+            # Pipe full, the reaper is going to wake up anyway
+            pass
+
+    def reap(self, process):
+        pid = process.pid
+        if pid in self.pending:
+            return
+        self._signal(pid, signal.SIGTERM)
+        self.pending[pid] = {"process": process, "deadline": time.monotonic() + self.grace, "killed": False}
+        if self.loop is None:
+            self.loop = eventlet.spawn(self._run)
+
+    def _signal(self, pgid, sig):
+        try:
+            os.killpg(pgid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def _group_alive(self, pgid):
+        try:
+            os.killpg(pgid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            # Exists but not ours (e.g. sudo), nothing more we can do
+            return True
+        return True
+
+    def _run(self):
+        try:
+            while self.pending:
+                try:
+                    trampoline(self.wake_r, read=True, timeout=self.poll_interval, timeout_exc=TimeoutError)
+                    while os.read(self.wake_r, 512):
+                        pass
+                except (TimeoutError, BlockingIOError):
+                    pass
+                self._check()
+        finally:
+            self.loop = None
+
+    def _check(self):
+        now = time.monotonic()
+        for pid, entry in list(self.pending.items()):
+            # Collects the session leader, the rest of the group is reparented
+            entry["process"].poll()
+            if entry["process"].returncode is not None and not self._group_alive(pid):
+                del self.pending[pid]
+            elif not entry["killed"] and now >= entry["deadline"]:
+                self._signal(pid, signal.SIGKILL)
+                entry["killed"] = True
+            elif entry["killed"] and now >= entry["deadline"] + self.grace:
+                print(f"Reaper: giving up on process group {pid}")
+                del self.pending[pid]
@@ -0,0 +1,102 @@
+import pyte
+from pyte import graphics
+
+# pyte colour name -> SGR code
+FG_CODES = {name: code for code, name in {**graphics.FG_ANSI, **graphics.FG_AIXTERM}.items()}
+BG_CODES = {name: code for code, name in {**graphics.BG_ANSI, **graphics.BG_AIXTERM}.items()}
+
+def _color(color, codes, truecolor):
+    if color in codes:
+        return str(codes[color])
+    # 256 and 24-bit colours are kept as hex by pyte
+    try:
+        r, g, b = int(color[0:2], 16), int(color[2:4], 16), int(color[4:6], 16)
+    except (ValueError, IndexError):
+        return None
+    return f"{truecolor};2;{r};{g};{b}"
+
+def _sgr(char):
+    params = ["0"]
+    if char.bold:
+        params.append("1")
+    if char.italics:
+        params.append("3")
+    if char.underscore:
+        params.append("4")
+    if char.blink:
+        params.append("5")
+    if char.reverse:
+        params.append("7")
+    if char.strikethrough:
+        params.append("9")
+    if char.fg != "default":
+        fg = _color(char.fg, FG_CODES, 38)
+        if fg:
+            params.append(fg)
+    if char.bg != "default":
+        bg = _color(char.bg, BG_CODES, 48)
+        if bg:
+            params.append(bg)
+    return "\x1b[" + ";".join(params) + "m"
+
+class ScreenMirror:
+    """
+    Server-side terminal emulator fed with a session's output.
+
+    snapshot() renders the visible screen as a compact ANSI string, which is
+    enough to restore a reattaching client without replaying the history.
+    """
+    def __init__(self, cols=80, rows=24):
+        self.screen = pyte.Screen(cols, rows)
+        self.stream = pyte.Stream(self.screen)
+
+    @property
+    def cols(self):
+        return self.screen.columns
+
+    @property
+    def rows(self):
+        return self.screen.lines
+
+    def feed(self, data):
+        self.stream.feed(data)
+
+    def resize(self, cols, rows):
+        self.screen.resize(lines=rows, columns=cols)
+
+    def snapshot(self):
+        screen = self.screen
+        default = _sgr(screen.default_char)
+        out = ["\x1b[0m\x1b[H\x1b[2J"]
+
+        for y in range(screen.lines):
+            line = screen.buffer[y]
+            # Skip trailing blank cells in the default style
+            last = -1
+            for x in range(screen.columns - 1, -1, -1):
+                char = line[x]
+                if char.data != " " or _sgr(char) != default:
+                    last = x
+                    break
+            if last < 0:
+                continue
+
+            out.append(f"\x1b[{y + 1};1H")
+            current = default
+            for x in range(last + 1):
+                char = line[x]
+                if not char.data:
+                    # Placeholder after a wide character
+                    continue
+                style = _sgr(char)
+                if style != current:
+                    out.append(style)
+                    current = style
+                out.append(char.data)
+            if current != default:
+                out.append("\x1b[0m")
+
+        cursor = screen.cursor
+        out.append(f"\x1b[{cursor.y + 1};{cursor.x + 1}H")
+        out.append("\x1b[?25l" if cursor.hidden else "\x1b[?25h")
+        return "".join(out)
@@ -0,0 +1,80 @@
+import os
+import gzip
+import tempfile
+from collections import deque
+
+class Scrollback:
+    """
+    Byte-capped terminal history.
+
+    The newest max_bytes stay in memory as fixed-size byte segments; older
+    segments are appended to a gzip file on disk, so memory per terminal
+    stays constant while the full history can still be streamed.
+    """
+    def __init__(self, max_bytes=1024 * 1024, segment_size=64 * 1024, spill_dir=None):
+        self.max_bytes = max_bytes
+        self.segment_size = segment_size
+        self.spill_dir = spill_dir
+        self.segments = deque()
+        self.current = bytearray()
+        self.mem_bytes = 0
+        self.spill_path = None
+        self.spilled_bytes = 0
+
+    def __len__(self):
+        return self.spilled_bytes + self.mem_bytes
+
+    def append(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.current += data
+        self.mem_bytes += len(data)
+
+        if len(self.current) >= self.segment_size:
+            self.segments.append(bytes(self.current))
+            self.current.clear()
+
+        spill = []
+        while self.mem_bytes > self.max_bytes and self.segments:
+            segment = self.segments.popleft()
+            self.mem_bytes -= len(segment)
+            spill.append(segment)
+        if spill:
+            self._spill(spill)
+
+    def _spill(self, segments):
+        if self.spill_path is None:
+            fd, self.spill_path = tempfile.mkstemp(prefix='ctf_scrollback_', suffix='.gz', dir=self.spill_dir)
+            os.close(fd)
+        # Every append adds a gzip member, gzip readers handle concatenated members
+        with gzip.open(self.spill_path, 'ab', compresslevel=1) as f:
+            for segment in segments:
+                f.write(segment)
+                self.spilled_bytes += len(segment)
+
+    def iter_chunks(self, chunk_size=64 * 1024):
+        """Yield the whole history as bytes chunks, oldest first."""
+        if self.spill_path:
+            with gzip.open(self.spill_path, 'rb') as f:
+                while True:
+                    chunk = f.read(chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+        # Snapshot so appends while streaming don't break iteration
+        for segment in list(self.segments):
+            yield segment
+        if self.current:
+            yield bytes(self.current)
+
+    def close(self):
+        if self.spill_path:
+            try:
+                os.remove(self.spill_path)
+            except OSError:
+                pass
+            self.spill_path = None
+        self.segments.clear()
+        self.current.clear()
+        self.mem_bytes = 0
+        self.spilled_bytes = 0
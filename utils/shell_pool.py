@@ -0,0 +1,62 @@
+import os
+from collections import deque
+import eventlet
+
+class ShellPool:
+    """
+    Pre-spawned shells waiting on their PTY for a terminal to claim them.
+
+    take() hands out a warm (master_fd, process) pair immediately; the pool
+    is refilled in a background greenthread so the fork/exec cost is paid
+    outside of the start_terminal request.
+    """
+    def __init__(self, size, spawn_fn):
+        self.size = size
+        # spawn_fn() -> (master_fd, process)
+        self.spawn_fn = spawn_fn
+        self.idle = deque()
+        self.refilling = False
+
+    def start(self):
+        self._schedule_refill()
+
+    def take(self):
+        shell = None
+        while self.idle:
+            master_fd, process = self.idle.popleft()
+            if process.poll() is None:
+                shell = (master_fd, process)
+                break
+            # Died while waiting (e.g. killed from outside)
+            try:
+                os.close(master_fd)
+            except OSError:
+                pass
+        self._schedule_refill()
+        return shell
+
+    def _schedule_refill(self):
+        if not self.refilling and len(self.idle) < self.size:
+            self.refilling = True
+            eventlet.spawn_n(self._refill)
+
+    def _refill(self):
+        try:
+            while len(self.idle) < self.size:
+                self.idle.append(self.spawn_fn())
+                # Let other greenthreads run between spawns
+                eventlet.sleep(0)
+        except OSError as e:
+            print(f"Shell pool refill failed: {e}")
+        finally:
+            self.refilling = False
+
+    def close(self):
+        while self.idle:
+            master_fd, process = self.idle.popleft()
+            try:
+                os.close(master_fd)
+            except OSError:
+                pass
+            process.kill()
+            process.wait()